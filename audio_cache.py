@@ -0,0 +1,103 @@
+import hashlib
+import os
+import subprocess
+import threading
+from pathlib import Path
+
+import numpy as np
+
+# Whisper 内部统一使用 16kHz 单声道 float32
+SAMPLE_RATE = 16000
+PCM_DTYPE = np.float32
+
+# 可通过环境变量指定共享缓存目录，供多个任务/进程共用
+CACHE_DIR_ENV = "WHISPER_PCM_CACHE"
+DEFAULT_CACHE_DIRNAME = ".pcm_cache"
+
+
+def source_hash(path, chunk_size=1 << 20):
+    """计算源文件的 SHA-256，作为缓存键"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def resolve_cache_dir(source, cache_dir=None):
+    """缓存目录优先级：环境变量 > 参数 > 源文件所在目录下的 .pcm_cache
+
+    调用方传入的目录只是各自的默认位置，设置环境变量后所有任务统一使用共享目录。
+    """
+    env_dir = os.environ.get(CACHE_DIR_ENV)
+    if env_dir:
+        return Path(env_dir)
+    if cache_dir:
+        return Path(cache_dir)
+    return Path(source).parent / DEFAULT_CACHE_DIRNAME
+
+
+def cache_path_for(source, cache_dir=None):
+    """返回源文件对应的 PCM 缓存文件路径（不保证已存在）"""
+    directory = resolve_cache_dir(source, cache_dir)
+    return directory / f"{source_hash(source)}.f32"
+
+
+def decode_to_pcm(source, pcm_path):
+    """用 FFmpeg 将音频解码为原始 16kHz 单声道 float32 PCM
+
+    先写入临时文件（按进程和线程区分）再原子替换，避免并行任务读到写了一半的缓存。
+    """
+    pcm_path = Path(pcm_path)
+    pcm_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = pcm_path.with_name(f"{pcm_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+
+    command = [
+        'ffmpeg',
+        '-nostdin',
+        '-threads', '0',
+        '-i', str(source),
+        '-f', 'f32le',
+        '-ac', '1',
+        '-ar', str(SAMPLE_RATE),
+        '-acodec', 'pcm_f32le',
+        str(tmp_path),
+        '-y'
+    ]
+    try:
+        subprocess.run(command, capture_output=True, check=True)
+        os.replace(tmp_path, pcm_path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return pcm_path
+
+
+def open_pcm(pcm_path):
+    """以 memmap 方式打开 PCM 缓存
+
+    使用写时复制模式('c')：页面通过系统页缓存在多次运行/多个进程间共享，
+    同时 torch.from_numpy 得到的是可写数组，不会触发只读警告。
+    """
+    if os.path.getsize(pcm_path) == 0:
+        return np.zeros(0, dtype=PCM_DTYPE)
+    return np.memmap(pcm_path, dtype=PCM_DTYPE, mode="c")
+
+
+def load_cached_audio(source, cache_dir=None):
+    """读取音频：命中缓存时直接映射，否则解码一次并写入缓存
+
+    返回值可直接传给 model.transcribe。
+    """
+    pcm_path = cache_path_for(source, cache_dir)
+    if pcm_path.exists():
+        print(f"命中PCM缓存: {pcm_path.name}")
+    else:
+        print("解码音频并写入PCM缓存...")
+        decode_to_pcm(source, pcm_path)
+    return open_pcm(pcm_path)
+
+
+def audio_duration(audio):
+    """PCM 数组对应的时长（秒）"""
+    return len(audio) / SAMPLE_RATE
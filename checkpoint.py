@@ -0,0 +1,146 @@
+import hashlib
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from audio_cache import SAMPLE_RATE, audio_duration
+from json_store import read_json, write_json_atomic
+from two_pass import shift_segment
+
+# Whisper 每个解码窗口 30 秒；默认每 10 个窗口（5 分钟音频）保存一次检查点
+WINDOW_SECONDS = 30
+CHECKPOINT_WINDOWS = 10
+
+MANIFEST_NAME = "manifest.json"
+
+
+def settings_digest(model_name, params, **extra):
+    """转录设置的摘要：模型、解码参数（语言、提示等）或其他设置变化时，
+    检查点和清单中的旧记录都会作废
+    """
+    data = json.dumps(
+        {'model': model_name, 'params': params, **extra},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()[:16]
+
+
+def model_identity(model, model_name=None):
+    """模型名称；未提供时用模型结构参数（区分 tiny/small/.en 等）代替"""
+    return model_name or repr(getattr(model, "dims", type(model).__name__))
+
+
+def checkpoint_path(output_dir, stem):
+    """字幕旁边的检查点文件"""
+    return Path(output_dir) / f"{stem}.ckpt.json"
+
+
+def transcribe_with_checkpoints(model, audio, params, checkpoint_file,
+                                windows_per_checkpoint=CHECKPOINT_WINDOWS, model_name=None):
+    """分块转录长音频，每 N 个窗口把已解码片段和音频偏移写入检查点
+
+    重启后从检查点的偏移继续。除最后一块外，每块的最后一个片段可能被块边界截断，
+    因此丢弃它并从它的开始时间继续下一块。全部完成后删除检查点。
+    检查点记录模型和解码参数的摘要，换模型或参数后不会续接旧的片段。
+    """
+    checkpoint_file = Path(checkpoint_file)
+    duration = audio_duration(audio)
+    chunk_seconds = WINDOW_SECONDS * max(1, windows_per_checkpoint)
+    settings = settings_digest(model_identity(model, model_name), params)
+
+    offset = 0.0
+    segments = []
+    language = params.get('language')
+    state = read_json(checkpoint_file)
+    # 采样数不一致说明源音频已变化，设置摘要不一致说明换了模型或参数，检查点均作废
+    if state and state.get('samples') == len(audio) and state.get('settings') == settings:
+        offset = state['offset']
+        segments = state['segments']
+        language = state.get('language') or language
+        print(f"从检查点恢复: {offset:.1f}s / {duration:.1f}s，已有 {len(segments)} 个片段")
+
+    while offset < duration:
+        end = min(duration, offset + chunk_seconds)
+        clip = np.ascontiguousarray(audio[int(offset * SAMPLE_RATE):int(end * SAMPLE_RATE)])
+        result = model.transcribe(clip, **params)
+        language = language or result.get('language')
+
+        chunk_segments = [shift_segment(segment, offset, end) for segment in result["segments"]]
+
+        next_offset = end
+        if end < duration and len(chunk_segments) > 1 and chunk_segments[-1]["start"] > offset:
+            next_offset = chunk_segments.pop()["start"]
+        segments.extend(chunk_segments)
+        offset = next_offset
+
+        if offset < duration:
+            write_json_atomic(checkpoint_file, {
+                'samples': len(audio),
+                'settings': settings,
+                'offset': offset,
+                'language': language,
+                'segments': segments,
+                'updated': time.time()
+            })
+
+    if checkpoint_file.exists():
+        checkpoint_file.unlink()
+
+    for i, segment in enumerate(segments):
+        segment["id"] = i
+    return {
+        'text': "".join(seg["text"] for seg in segments),
+        'segments': segments,
+        'language': language
+    }
+
+
+class BatchManifest:
+    """记录批量任务中已完成与失败的文件，重跑时只处理剩余部分
+
+    文件以绝对路径为键，并记录大小、修改时间和转录设置摘要；
+    文件被替换或换了模型/参数后会重新处理。
+    """
+
+    def __init__(self, output_dir):
+        self.path = Path(output_dir) / MANIFEST_NAME
+        data = read_json(self.path) or {}
+        self.completed = data.get('completed', {})
+        self.failed = data.get('failed', {})
+
+    @staticmethod
+    def _key(audio_file):
+        return str(Path(audio_file).absolute())
+
+    @staticmethod
+    def _stat(audio_file):
+        stat = Path(audio_file).stat()
+        return {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+    def is_completed(self, audio_file, settings=None):
+        entry = self.completed.get(self._key(audio_file))
+        if not entry or entry.get('settings') != settings:
+            return False
+        stat = self._stat(audio_file)
+        return entry['size'] == stat['size'] and entry['mtime'] == stat['mtime']
+
+    def mark_completed(self, audio_file, outputs=(), settings=None):
+        key = self._key(audio_file)
+        self.failed.pop(key, None)
+        self.completed[key] = dict(
+            self._stat(audio_file), settings=settings,
+            outputs=[str(p) for p in outputs], time=time.time()
+        )
+        self.save()
+
+    def mark_failed(self, audio_file, error):
+        key = self._key(audio_file)
+        self.completed.pop(key, None)
+        self.failed[key] = {'error': str(error), 'time': time.time()}
+        self.save()
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(self.path, {'completed': self.completed, 'failed': self.failed})
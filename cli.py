@@ -0,0 +1,270 @@
+"""统一命令行入口（非交互，可用于 cron 和并行 shell 管道）
+
+    python cli.py download URL
+    python cli.py cut VIDEO --start 00:01:00 --end 00:03:00
+    python cli.py extract VIDEO
+    python cli.py transcribe A.mp3 B.mp3 --formats srt,vtt
+    python cli.py burn VIDEO SUB
+    python cli.py mux VIDEO SUB
+    python cli.py batch --input-dir DIR --output-dir OUT
+    python cli.py run URL_OR_FILE --start 00:01:00      # 下载/截取/提取/转录一条龙
+    python cli.py watch DIR --mode transcribe|merge      # 持续处理新到达的文件
+
+所有选项也可以写在 JSON 配置文件中（--config），顶层键对所有子命令生效，
+以子命令名为键的对象只对该子命令生效，命令行参数优先。
+
+whisper/torch/numpy 只在需要的子命令内部导入，--help 与非模型子命令可以毫秒级启动。
+"""
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+
+def parse_formats(value):
+    """'srt,vtt' 或 ['srt', 'vtt'] -> ('srt', 'vtt')"""
+    if isinstance(value, str):
+        value = value.split(",")
+    return tuple(fmt.strip().lower() for fmt in value if fmt.strip())
+
+
+def cmd_download(args):
+    from script import VideoProcessor
+    processor = VideoProcessor(args.url, args.output_dir)
+    video_file = processor.get_video_file()
+    if not video_file:
+        return 1
+    print(video_file)
+    return 0
+
+
+def cmd_cut(args):
+    from script import VideoProcessor
+    processor = VideoProcessor(args.input, args.output_dir)
+    output = processor.cut_video(args.input, args.start, args.end)
+    if not output:
+        return 1
+    print(output)
+    return 0
+
+
+def cmd_extract(args):
+    from script import VideoProcessor
+    output = VideoProcessor.extract_audio(args.input)
+    if not output:
+        return 1
+    print(output)
+    return 0
+
+
+def cmd_transcribe(args):
+    from main import process_mp3_files
+    succeeded, failed = process_mp3_files(
+        output_dir=args.output_dir,
+        files=args.files,
+        model_size=args.model,
+        formats=parse_formats(args.formats),
+        language=args.language,
+        two_pass=args.two_pass,
+        threads=args.threads,
+        checkpoint_windows=args.checkpoint_windows,
+        resume=not args.force,
+        dedup=not args.no_dedup
+    )
+    return 1 if failed or not succeeded else 0
+
+
+def cmd_batch(args):
+    from main import process_mp3_files
+    succeeded, failed = process_mp3_files(
+        input_dir=args.input_dir,
+        output_dir=args.output_dir,
+        model_size=args.model,
+        formats=parse_formats(args.formats),
+        language=args.language,
+        two_pass=args.two_pass,
+        threads=args.threads,
+        checkpoint_windows=args.checkpoint_windows,
+        resume=not args.force,
+        dedup=not args.no_dedup
+    )
+    return 1 if failed or not succeeded else 0
+
+
+def cmd_burn(args):
+    from set_sub import merge_video_subtitle
+    output = args.output or str(Path(args.video).with_name(f"{Path(args.video).stem}_with_subtitle.mp4"))
+    if not merge_video_subtitle(args.video, args.subtitle, output):
+        return 1
+    print(output)
+    return 0
+
+
+def cmd_mux(args):
+    from set_sub import mux_video_subtitle
+    output = args.output or str(Path(args.video).with_name(f"{Path(args.video).stem}_muxed{Path(args.video).suffix}"))
+    if not mux_video_subtitle(args.video, args.subtitle, output, args.language):
+        return 1
+    print(output)
+    return 0
+
+
+def cmd_run(args):
+    from script import VideoProcessor
+    processor = VideoProcessor(args.source, args.output_dir)
+    video_file = processor.get_video_file()
+    if video_file and (args.start or args.end):
+        video_file = processor.cut_video(video_file, args.start or "00:00:00", args.end)
+    if not video_file:
+        return 1
+    audio_file = processor.extract_audio(video_file)
+    if not audio_file:
+        return 1
+    subtitle = processor.generate_subtitle(audio_file, parse_formats(args.formats))
+    if not subtitle:
+        return 1
+    print(subtitle)
+    return 0
+
+
+def cmd_watch(args):
+    from watch import STATE_NAME, MergeTarget, TranscribeTarget, watch
+    if args.mode == "transcribe":
+        output_dir = args.output_dir or os.path.join(args.directory, "srt_output")
+        target = TranscribeTarget(output_dir, args.workers, args.model, args.language,
+                                  parse_formats(args.formats), dedup=not args.no_dedup)
+    else:
+        output_dir = args.output_dir or args.directory
+        target = MergeTarget(args.output_dir, args.workers)
+    state_file = args.state or os.path.join(output_dir, STATE_NAME)
+    watch(args.directory, target, state_file, args.debounce, args.interval, args.polling)
+    return 0
+
+
+def add_transcribe_options(parser):
+    parser.add_argument("--output-dir", default=".", help="字幕输出目录")
+    parser.add_argument("--model", default="tiny", help="Whisper 模型大小")
+    parser.add_argument("--language", default=None, help="音频语言，默认 ja")
+    parser.add_argument("--formats", default="srt", help="字幕格式，逗号分隔：srt,vtt,ass,json")
+    parser.add_argument("--two-pass", action="store_true", default=None,
+                        help="启用两遍转录（低置信度片段用大模型重解码）")
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 4, help="torch 线程数")
+    parser.add_argument("--checkpoint-windows", type=int, default=10,
+                        help="每隔多少个 30 秒窗口保存一次检查点，0 表示关闭")
+    parser.add_argument("--force", action="store_true", help="忽略清单，重新处理已完成的文件")
+    parser.add_argument("--no-dedup", action="store_true", help="关闭音频指纹去重")
+
+
+# 可以由配置文件提供的必填选项，合并配置后再检查
+REQUIRED_OPTIONS = {
+    "batch": ("input_dir",),
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="YouTube 视频字幕工具")
+    parser.add_argument("--config", help="JSON 配置文件")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    commands = {}
+
+    # 子命令也接受 --config，可写在子命令参数之后；SUPPRESS 避免覆盖顶层的值
+    config_parent = argparse.ArgumentParser(add_help=False)
+    config_parent.add_argument("--config", default=argparse.SUPPRESS, help="JSON 配置文件")
+
+    def add(name, func, help_text):
+        sub = subparsers.add_parser(name, help=help_text, parents=[config_parent])
+        sub.set_defaults(func=func)
+        commands[name] = sub
+        return sub
+
+    sub = add("download", cmd_download, "下载视频、封面和平台字幕")
+    sub.add_argument("url")
+    sub.add_argument("--output-dir", default=None, help="输出根目录，默认 video_output")
+
+    sub = add("cut", cmd_cut, "截取视频片段（不重新编码）")
+    sub.add_argument("input")
+    sub.add_argument("--start", default="00:00:00", help="开始时间 HH:MM:SS")
+    sub.add_argument("--end", default=None, help="结束时间 HH:MM:SS，默认到结尾")
+    sub.add_argument("--output-dir", default=None, help="输出根目录，默认 video_output")
+
+    sub = add("extract", cmd_extract, "从视频提取 MP3 音频（保存在视频旁边）")
+    sub.add_argument("input")
+
+    sub = add("transcribe", cmd_transcribe, "转录指定的音频文件")
+    sub.add_argument("files", nargs="+")
+    add_transcribe_options(sub)
+
+    sub = add("batch", cmd_batch, "批量转录目录下的全部 MP3")
+    sub.add_argument("--input-dir", default=None, help="MP3 所在目录（必填，可写在配置文件中）")
+    add_transcribe_options(sub)
+
+    sub = add("burn", cmd_burn, "将字幕烧录进画面")
+    sub.add_argument("video")
+    sub.add_argument("subtitle")
+    sub.add_argument("--output", default=None)
+
+    sub = add("mux", cmd_mux, "将字幕作为软字幕轨道封装（不重新编码）")
+    sub.add_argument("video")
+    sub.add_argument("subtitle")
+    sub.add_argument("--output", default=None)
+    sub.add_argument("--language", default=None, help="字幕轨道语言标签，例如 jpn")
+
+    sub = add("run", cmd_run, "URL 或本地视频的完整处理流程")
+    sub.add_argument("source")
+    sub.add_argument("--start", default=None, help="开始时间 HH:MM:SS")
+    sub.add_argument("--end", default=None, help="结束时间 HH:MM:SS")
+    sub.add_argument("--formats", default="srt", help="字幕格式，逗号分隔：srt,vtt,ass,json")
+    sub.add_argument("--output-dir", default=None, help="输出根目录，默认 video_output")
+
+    sub = add("watch", cmd_watch, "监视目录，持续转录或合并新到达的文件")
+    sub.add_argument("directory")
+    sub.add_argument("--mode", choices=("transcribe", "merge"), default="transcribe")
+    sub.add_argument("--output-dir", default=None, help="输出目录，转录默认 <目录>/srt_output，合并默认原目录")
+    sub.add_argument("--workers", type=int, default=1, help="并行工作进程/线程数")
+    sub.add_argument("--model", default="tiny", help="Whisper 模型大小")
+    sub.add_argument("--language", default=None, help="音频语言，默认 ja")
+    sub.add_argument("--formats", default="srt", help="字幕格式，逗号分隔：srt,vtt,ass,json")
+    sub.add_argument("--debounce", type=float, default=5.0, help="文件最后一次变化后等待的秒数")
+    sub.add_argument("--interval", type=float, default=2.0, help="轮询间隔（秒）")
+    sub.add_argument("--polling", action="store_true", help="强制使用轮询而不是 inotify")
+    sub.add_argument("--no-dedup", action="store_true", help="关闭音频指纹去重（仅转录模式）")
+    sub.add_argument("--state", default=None, help="已处理文件状态文件，默认在输出目录下")
+
+    return parser, commands
+
+
+def apply_config(commands, config_path):
+    """用配置文件的值覆盖各子命令的默认值"""
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    shared = {k: v for k, v in config.items() if not isinstance(v, dict)}
+    for name, sub in commands.items():
+        values = dict(shared, **config.get(name, {}))
+        known = {action.dest for action in sub._actions}
+        sub.set_defaults(**{
+            key.replace("-", "_"): value for key, value in values.items()
+            if key.replace("-", "_") in known
+        })
+
+
+def main(argv=None):
+    parser, commands = build_parser()
+    pre_parser = argparse.ArgumentParser(add_help=False)
+    pre_parser.add_argument("--config")
+    pre_args, _ = pre_parser.parse_known_args(argv)
+    if pre_args.config:
+        apply_config(commands, pre_args.config)
+
+    args = parser.parse_args(argv)
+    missing = [
+        "--" + dest.replace("_", "-") for dest in REQUIRED_OPTIONS.get(args.command, ())
+        if getattr(args, dest, None) in (None, "")
+    ]
+    if missing:
+        commands[args.command].error(f"缺少必填选项: {', '.join(missing)}")
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
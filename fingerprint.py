@@ -0,0 +1,243 @@
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from audio_cache import SAMPLE_RATE
+from two_pass import shift_segment
+
+# 指纹在 8kHz 上计算：对 16kHz PCM 两两平均即可，足够覆盖语音频段
+FP_SAMPLE_RATE = SAMPLE_RATE // 2
+N_FFT = 1024
+HOP = 256
+HOP_SECONDS = HOP / FP_SAMPLE_RATE          # 32ms，偏移匹配的时间精度
+BLOCK_FRAMES = 8192                         # 分块计算频谱，控制长音频的内存占用
+
+# 约 300Hz-3.5kHz 的对数频带，每个频带每帧取一个最强频点
+BAND_EDGES = np.geomspace(40, 448, 7).astype(int)
+PEAK_NEIGHBORHOOD = 5                       # 时间方向 ±5 帧内的局部最大值才算峰值
+FAN_OUT = 8                                 # 每个锚点与其后最多 8 个峰值配对
+MAX_DT = 63                                 # 配对峰值的最大帧间隔（约 2 秒）
+
+# 判定为重复音频的阈值
+MIN_MATCHES = 20
+MIN_MATCH_RATIO = 0.2                       # 对齐票数占查询哈希数的最低比例
+BUCKET_SECONDS = 10.0
+MIN_BUCKET_RATIO = 0.05                     # 10 秒分段内对齐命中达到此比例才算该分段匹配
+MIN_BUCKET_COVERAGE = 0.9                   # 匹配分段占查询音频全部分段的最低比例
+COVERAGE_TOLERANCE = 1.0                    # 秒
+
+SOURCE_DUPLICATE = "duplicate"
+
+# 索引文件默认保存在输出目录中，跨批次共享
+INDEX_NAME = "fingerprints.db"
+
+# 保存到索引中的片段字段（去掉 tokens 等大字段）
+STORED_SEGMENT_KEYS = ("start", "end", "text", "words", "avg_logprob", "no_speech_prob", "compression_ratio")
+
+
+class Fingerprint:
+    def __init__(self, hashes, times, duration):
+        self.hashes = hashes    # int64 哈希
+        self.times = times      # 锚点所在帧
+        self.duration = duration
+
+
+def _band_peaks(audio):
+    """分块计算频谱，返回每帧每个频带的 (最大幅度, 频点下标)"""
+    x = np.asarray(audio, dtype=np.float32)
+    n = len(x) // 2 * 2
+    x = (x[0:n:2] + x[1:n:2]) * 0.5
+    bands = len(BAND_EDGES) - 1
+    if len(x) < N_FFT:
+        return np.zeros((0, bands), np.float32), np.zeros((0, bands), np.int64)
+
+    window = np.hanning(N_FFT).astype(np.float32)
+    total = 1 + (len(x) - N_FFT) // HOP
+    band_max = np.empty((total, bands), dtype=np.float32)
+    band_arg = np.empty((total, bands), dtype=np.int64)
+    for start in range(0, total, BLOCK_FRAMES):
+        stop = min(total, start + BLOCK_FRAMES)
+        frames = sliding_window_view(x[start * HOP:(stop - 1) * HOP + N_FFT], N_FFT)[::HOP]
+        spec = np.abs(np.fft.rfft(frames * window, axis=1))
+        rows = np.arange(stop - start)
+        for b in range(bands):
+            lo, hi = BAND_EDGES[b], BAND_EDGES[b + 1]
+            arg = spec[:, lo:hi].argmax(axis=1)
+            band_arg[start:stop, b] = arg + lo
+            band_max[start:stop, b] = spec[rows, arg + lo]
+    return band_max, band_arg
+
+
+def compute_fingerprint(audio):
+    """对 16kHz PCM 计算频谱峰值配对哈希（对码率、封装格式和音量变化不敏感）"""
+    duration = len(audio) / SAMPLE_RATE
+    band_max, band_arg = _band_peaks(audio)
+    if len(band_max) == 0:
+        return Fingerprint(np.zeros(0, np.int64), np.zeros(0, np.int64), duration)
+
+    magnitude = np.log(band_max + 1e-9)
+    padded = np.pad(magnitude, ((PEAK_NEIGHBORHOOD, PEAK_NEIGHBORHOOD), (0, 0)), constant_values=-np.inf)
+    local_max = sliding_window_view(padded, 2 * PEAK_NEIGHBORHOOD + 1, axis=0).max(axis=-1)
+    is_peak = (magnitude == local_max) & (magnitude > np.median(magnitude, axis=0)) & (band_max > 1e-3)
+
+    # np.nonzero 按行优先返回，峰值已按时间排序
+    t, b = np.nonzero(is_peak)
+    f = band_arg[t, b]
+
+    hashes, times = [], []
+    for j in range(1, FAN_OUT + 1):
+        if len(t) <= j:
+            break
+        dt = t[j:] - t[:-j]
+        valid = (dt >= 1) & (dt <= MAX_DT)
+        hashes.append((f[:-j][valid] << 16) | (f[j:][valid] << 6) | dt[valid])
+        times.append(t[:-j][valid])
+    if not hashes:
+        return Fingerprint(np.zeros(0, np.int64), np.zeros(0, np.int64), duration)
+    return Fingerprint(np.concatenate(hashes), np.concatenate(times), duration)
+
+
+class FingerprintIndex:
+    """保存在 SQLite 中的指纹索引及对应的转录结果"""
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS files (
+                id INTEGER PRIMARY KEY,
+                path TEXT,
+                duration REAL,
+                transcript TEXT,
+                added REAL
+            );
+            CREATE TABLE IF NOT EXISTS hashes (hash INTEGER, file_id INTEGER, t INTEGER);
+            CREATE INDEX IF NOT EXISTS idx_hashes_hash ON hashes (hash);
+        """)
+
+    def _ids_for_path(self, path):
+        return [row[0] for row in self.conn.execute("SELECT id FROM files WHERE path = ?", (str(path),))]
+
+    def add(self, path, fingerprint, result):
+        """登记一个已转录文件的指纹和转录结果（同一路径的旧记录会被替换）"""
+        transcript = {
+            'language': result.get('language'),
+            'segments': [
+                {k: seg[k] for k in STORED_SEGMENT_KEYS if k in seg}
+                for seg in result["segments"]
+            ]
+        }
+        with self.conn:
+            for old_id in self._ids_for_path(path):
+                self.conn.execute("DELETE FROM hashes WHERE file_id = ?", (old_id,))
+                self.conn.execute("DELETE FROM files WHERE id = ?", (old_id,))
+            cursor = self.conn.execute(
+                "INSERT INTO files (path, duration, transcript, added) VALUES (?, ?, ?, ?)",
+                (str(path), fingerprint.duration, json.dumps(transcript, ensure_ascii=False), time.time())
+            )
+            file_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT INTO hashes (hash, file_id, t) VALUES (?, ?, ?)",
+                zip(fingerprint.hashes.tolist(), [file_id] * len(fingerprint.hashes), fingerprint.times.tolist())
+            )
+        return file_id
+
+    def _lookup(self, unique_hashes, chunk_size=900):
+        rows = []
+        for i in range(0, len(unique_hashes), chunk_size):
+            chunk = unique_hashes[i:i + chunk_size].tolist()
+            placeholders = ",".join("?" * len(chunk))
+            rows.extend(self.conn.execute(
+                f"SELECT hash, file_id, t FROM hashes WHERE hash IN ({placeholders})", chunk
+            ))
+        return np.array(rows, dtype=np.int64).reshape(-1, 3)
+
+    def find_match(self, fingerprint, exclude_path=None):
+        """查找近似重复的已转录音频（支持整体偏移）
+
+        返回 {'file_id', 'path', 'start', 'score'}，start 为查询音频起点在匹配文件中的时间；
+        对齐的命中必须分布在查询音频的绝大部分时段（只共享片头的不同剧集不算重复），
+        且匹配文件必须完整覆盖查询音频，否则返回 None。exclude_path 的旧记录不参与匹配，
+        这样对同一文件换模型重新转录时不会复用自己上一次的结果。
+        """
+        if len(fingerprint.hashes) < MIN_MATCHES:
+            return None
+        order = np.argsort(fingerprint.hashes, kind="stable")
+        q_hashes = fingerprint.hashes[order]
+        q_times = fingerprint.times[order]
+        rows = self._lookup(np.unique(q_hashes))
+        if exclude_path is not None and len(rows):
+            rows = rows[~np.isin(rows[:, 1], self._ids_for_path(exclude_path))]
+        if len(rows) == 0:
+            return None
+
+        # 每条命中与查询中所有相同哈希配对，统计 (文件, 帧偏移) 的票数
+        left = np.searchsorted(q_hashes, rows[:, 0], side="left")
+        right = np.searchsorted(q_hashes, rows[:, 0], side="right")
+        counts = right - left
+        row_idx = np.repeat(np.arange(len(rows)), counts)
+        q_idx = np.repeat(left, counts) + (np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts))
+        deltas = rows[row_idx, 2] - q_times[q_idx]
+        keys = rows[row_idx, 1] * (1 << 32) + (deltas + (1 << 31))
+        unique_keys, raw_votes = np.unique(keys, return_counts=True)
+        # 起点不在帧边界上时，同一偏移的票会分散到相邻两帧，合并后再比较
+        pos = np.minimum(np.searchsorted(unique_keys, unique_keys + 1), len(unique_keys) - 1)
+        has_next = unique_keys[pos] == unique_keys + 1
+        votes = raw_votes + np.where(has_next, raw_votes[pos], 0)
+        best = votes.argmax()
+        score = int(votes[best])
+        if score < MIN_MATCHES or score < MIN_MATCH_RATIO * len(fingerprint.hashes):
+            return None
+
+        # 对齐命中必须分布在查询音频的绝大部分 10 秒分段中，
+        # 只统计查询中本身有哈希的分段（跳过静音）
+        bucket_frames = max(1, int(round(BUCKET_SECONDS / HOP_SECONDS)))
+        aligned = (keys == unique_keys[best]) | (keys == unique_keys[best] + 1)
+        hits = np.bincount(q_times[q_idx[aligned]] // bucket_frames)
+        totals = np.bincount(fingerprint.times // bucket_frames)
+        hits = np.pad(hits, (0, len(totals) - len(hits)))
+        matched = np.count_nonzero((totals > 0) & (hits >= MIN_BUCKET_RATIO * totals))
+        if matched < MIN_BUCKET_COVERAGE * np.count_nonzero(totals):
+            return None
+
+        # 偏移取合并的两帧中原始票数较多的一帧
+        best_key = unique_keys[best]
+        if has_next[best] and raw_votes[pos[best]] > raw_votes[best]:
+            best_key = unique_keys[pos[best]]
+        file_id = int(best_key >> 32)
+        start = float(int(best_key & 0xFFFFFFFF) - (1 << 31)) * HOP_SECONDS
+        path, duration = self.conn.execute(
+            "SELECT path, duration FROM files WHERE id = ?", (file_id,)
+        ).fetchone()
+        if start < -COVERAGE_TOLERANCE or start + fingerprint.duration > duration + COVERAGE_TOLERANCE:
+            return None
+        return {'file_id': file_id, 'path': path, 'start': start, 'score': score}
+
+    def reuse_transcript(self, match, duration):
+        """取出匹配文件的转录，并平移到查询音频的时间轴"""
+        (transcript,) = self.conn.execute(
+            "SELECT transcript FROM files WHERE id = ?", (match['file_id'],)
+        ).fetchone()
+        transcript = json.loads(transcript)
+        segments = []
+        for segment in transcript['segments']:
+            segment = shift_segment(segment, -match['start'], duration)
+            if segment["end"] <= 0 or segment["start"] >= duration:
+                continue
+            segment["start"] = max(0.0, segment["start"])
+            segment["id"] = len(segments)
+            segments.append(segment)
+        return {
+            'language': transcript.get('language'),
+            'text': "".join(seg["text"] for seg in segments),
+            'segments': segments
+        }
+
+    def close(self):
+        self.conn.close()
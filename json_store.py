@@ -0,0 +1,22 @@
+import json
+import os
+import threading
+from pathlib import Path
+
+
+def write_json_atomic(path, data):
+    """先写临时文件再替换，进程中途被杀也不会留下损坏的 JSON"""
+    path = Path(path)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def read_json(path):
+    """读取 JSON，文件不存在或损坏时返回 None"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
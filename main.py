@@ -4,32 +4,35 @@ import os
 from pathlib import Path
 import warnings
 import subprocess
+import gc
 import torch
 import numpy as np
 from collections import Counter
+from audio_cache import load_cached_audio
+from subtitle_export import write_subtitles
+from platform_subs import SOURCE_PLATFORM, SOURCE_PROMPTED, format_source_stats, plan_from_tracks, prompted_params
+from two_pass import DEFAULT_REDO_THRESHOLDS, format_report, refine_draft
+from fingerprint import INDEX_NAME, SOURCE_DUPLICATE, FingerprintIndex, compute_fingerprint
+from checkpoint import CHECKPOINT_WINDOWS, BatchManifest, checkpoint_path, settings_digest, transcribe_with_checkpoints
 
 warnings.filterwarnings("ignore")
 
 # 设置 FFmpeg 路径
 os.environ["PATH"] += os.pathsep + r"D:\fzwork\ffmpeg-2023-11-05-git-44a0148fad-essentials_build\bin"
 
-def format_timestamp(seconds):
-    """优化时间戳格式转换效率"""
-    total_seconds = int(seconds)
-    hours, remainder = divmod(total_seconds, 3600)
-    minutes, seconds = divmod(remainder, 60)
-    milliseconds = int((seconds - int(seconds)) * 1000)
-    return f"{hours:02d}:{minutes:02d}:{int(seconds):02d},{milliseconds:03d}"
-
-def create_srt(result):
-    """优化SRT创建效率，减少字符串操作次数"""
-    segments = []
-    for i, segment in enumerate(result["segments"], start=1):
-        start_time = format_timestamp(segment["start"])
-        end_time = format_timestamp(segment["end"])
-        text = segment["text"].strip()
-        segments.append(f"{i}\n{start_time} --> {end_time}\n{text}\n")
-    return "\n".join(segments)
+# 默认输入/输出目录
+INPUT_DIR = r"D:\fzwork\ai\mp3sub"
+OUTPUT_DIR = r"D:\fzwork\ai\mp3sub\srt_output"
+
+# 输出的字幕格式，可选 srt / vtt / ass / json
+SUBTITLE_FORMATS = ("srt",)
+
+# 两遍转录：tiny 出草稿，只对低置信度片段用大模型重解码
+TWO_PASS = {
+    'enabled': False,
+    'hq_model': "small",
+    'thresholds': DEFAULT_REDO_THRESHOLDS
+}
 
 def optimize_transcription_settings():
     """为CPU环境优化的转录参数设置"""
@@ -50,9 +53,78 @@ def optimize_transcription_settings():
         'word_timestamps': False  # 关闭词级时间戳可显著提高速度
     }
 
-def process_mp3_files():
-    input_dir = r"D:\fzwork\ai\mp3sub"
-    output_dir = r"D:\fzwork\ai\mp3sub\srt_output"
+def transcribe_file(model, audio_file, output_dir, transcription_params,
+                    formats=SUBTITLE_FORMATS, cache_dir=None, load_hq_model=None,
+                    checkpoint_windows=CHECKPOINT_WINDOWS, fingerprint_index=None, model_name=None):
+    """转录单个音频文件并写出字幕
+
+    checkpoint_windows > 0 时每隔这么多个 30 秒窗口保存一次检查点，中断后可从断点继续。
+    传入 fingerprint_index 时，与已转录音频近似重复（含偏移）的文件直接复用已有转录。
+    model_name 记录在检查点中，换模型后不会续接旧模型的片段。
+
+    返回包含 source（字幕来源）、paths（字幕文件）、avg_logprob、report（两遍转录报告）的字典。
+    """
+    audio_file = Path(audio_file)
+    summary = {'source': None, 'paths': {}, 'avg_logprob': None, 'report': None}
+
+    # MP3 旁边有 yt-dlp 下载的字幕轨道（<名称>.ja.srt）时优先复用
+    source, hint = plan_from_tracks(audio_file, audio_file, transcription_params['language'])
+    summary['source'] = source
+    if source == SOURCE_PLATFORM:
+        summary['paths'] = write_subtitles(hint, output_dir, audio_file.stem, formats)
+        return summary
+    if source == SOURCE_PROMPTED:
+        transcription_params = prompted_params(transcription_params, hint)
+
+    # 解码结果缓存为PCM，重复运行时直接映射而无需重新解码
+    audio = load_cached_audio(audio_file.absolute(), cache_dir)
+    
+    fingerprint = None
+    if fingerprint_index is not None:
+        fingerprint = compute_fingerprint(audio)
+        match = fingerprint_index.find_match(fingerprint, exclude_path=audio_file.absolute())
+        if match:
+            print(f"检测到重复音频: {Path(match['path']).name}（偏移 {match['start']:.2f}s），复用已有转录")
+            result = fingerprint_index.reuse_transcript(match, fingerprint.duration)
+            summary['source'] = SOURCE_DUPLICATE
+            summary['paths'] = write_subtitles(result, output_dir, audio_file.stem, formats)
+            return summary
+    
+    if checkpoint_windows:
+        result = transcribe_with_checkpoints(
+            model, audio, transcription_params,
+            checkpoint_path(output_dir, audio_file.stem), checkpoint_windows,
+            model_name=model_name
+        )
+    else:
+        result = model.transcribe(audio, **transcription_params)
+    if load_hq_model is not None:
+        result, summary['report'] = refine_draft(
+            result, load_hq_model, audio, transcription_params,
+            thresholds=TWO_PASS['thresholds']
+        )
+
+    summary['paths'] = write_subtitles(result, output_dir, audio_file.stem, formats)
+    if fingerprint is not None:
+        fingerprint_index.add(audio_file.absolute(), fingerprint, result)
+
+    # 收集置信度信息用于统计
+    file_logprobs = [seg.get("avg_logprob", 0) for seg in result["segments"]]
+    if file_logprobs:
+        summary['avg_logprob'] = sum(file_logprobs) / len(file_logprobs)
+    return summary
+
+def process_mp3_files(input_dir=INPUT_DIR, output_dir=OUTPUT_DIR, files=None,
+                      model_size="tiny", formats=SUBTITLE_FORMATS, language=None,
+                      two_pass=None, threads=4, checkpoint_windows=CHECKPOINT_WINDOWS,
+                      resume=True, dedup=True):
+    """批量转录 input_dir 下的 MP3（或直接指定 files），返回 (成功数, 失败数)
+
+    resume 为 True 时跳过 output_dir/manifest.json 中已完成且未修改的文件。
+    dedup 为 True 时用 output_dir/fingerprints.db 检测重复上传/转码的音频。
+    FFmpeg 不可用或没有找到文件时返回 (0, 1)，调用方据此以非零状态退出。
+    """
+    two_pass = TWO_PASS['enabled'] if two_pass is None else two_pass
     
     os.makedirs(output_dir, exist_ok=True)
     
@@ -62,76 +134,113 @@ def process_mp3_files():
         print("FFmpeg 验证成功！")
     except Exception as e:
         print(f"FFmpeg 错误: {e}\n请确保FFmpeg路径正确配置！")
-        return
+        return 0, 1
+
+    mp3_files = [Path(f) for f in files] if files is not None else list(Path(input_dir).glob("*.mp3"))
+    
+    if not mp3_files:
+        print(f"在目录 {input_dir} 中未找到MP3文件！")
+        return 0, 1
+    
+    print(f"找到 {len(mp3_files)} 个MP3文件")
+    
+    # 获取优化的转录参数
+    transcription_params = optimize_transcription_settings()
+    if language:
+        transcription_params['language'] = language
+
+    # 清单记录已完成/失败的文件，重跑时只处理剩余部分；换模型或参数后视为未完成
+    settings = settings_digest(
+        model_size, transcription_params, formats=list(formats),
+        hq_model=TWO_PASS['hq_model'] if two_pass else None
+    )
+    manifest = BatchManifest(output_dir)
+    if resume:
+        done_files = [f for f in mp3_files if f.exists() and manifest.is_completed(f, settings)]
+        if done_files:
+            print(f"跳过 {len(done_files)} 个已完成的文件")
+            mp3_files = [f for f in mp3_files if f not in done_files]
+        if not mp3_files:
+            print("全部文件均已完成")
+            return len(done_files), 0
 
     # CPU优化设置
     device = "cpu"
     print("正在加载优化后的Whisper模型...")
     
-    # 使用更小的模型以提高速度
-    model_size = "tiny"  # 在CPU上推荐使用tiny或small
+    # 使用更小的模型以提高速度，在CPU上推荐使用tiny或small
     model = whisper.load_model(model_size, device=device)
-    
-    # 获取优化的转录参数
-    transcription_params = optimize_transcription_settings()
     print(f"已加载 {model_size} 模型并应用CPU优化参数设置")
 
-    mp3_files = list(Path(input_dir).glob("*.mp3"))
+    # 大模型只在第一次遇到需要重解码的片段时加载，之后复用
+    hq_models = {}
+    def load_hq_model():
+        if 'model' not in hq_models:
+            print(f"正在加载重解码用 {TWO_PASS['hq_model']} 模型...")
+            hq_models['model'] = whisper.load_model(TWO_PASS['hq_model'], device=device)
+        return hq_models['model']
     
-    if not mp3_files:
-        print(f"在目录 {input_dir} 中未找到MP3文件！")
-        return
+    # 尝试多线程加速（如果您的CPU支持）
+    # 注意：Windows上可能效果有限，但可能略有帮助
+    torch.set_num_threads(threads)  # 根据CPU核心数调整
     
-    print(f"找到 {len(mp3_files)} 个MP3文件")
+    fingerprint_index = FingerprintIndex(Path(output_dir) / INDEX_NAME) if dedup else None
     
     # 文件处理统计
     success_count = 0
     fail_count = 0
     logprobs = []
+    redecoded_seconds = 0.0
+    total_seconds = 0.0
+    subtitle_sources = []
     
     # 按文件大小排序：先处理小文件以快速获得结果
-    files_by_size = sorted(mp3_files, key=lambda f: f.stat().st_size)
+    files_by_size = sorted(mp3_files, key=lambda f: f.stat().st_size if f.exists() else 0)
     
     for i, audio_file in enumerate(files_by_size, 1):
-        print(f"\n[{i}/{len(mp3_files)}] 正在处理: {audio_file.name} "
-              f"({audio_file.stat().st_size/1024/1024:.1f} MB)")
-        
         if not audio_file.exists():
-            print(f"错误：文件不存在 - {audio_file}")
+            print(f"\n[{i}/{len(mp3_files)}] 错误：文件不存在 - {audio_file}")
+            manifest.mark_failed(audio_file, "文件不存在")
             fail_count += 1
             continue
+        
+        print(f"\n[{i}/{len(mp3_files)}] 正在处理: {audio_file.name} "
+              f"({audio_file.stat().st_size/1024/1024:.1f} MB)")
             
         try:
-            # 尝试多线程加速（如果您的CPU支持）
-            # 注意：Windows上可能效果有限，但可能略有帮助
-            torch.set_num_threads(4)  # 根据CPU核心数调整
-            
-            result = model.transcribe(
-                str(audio_file.absolute()),
-                **transcription_params
+            summary = transcribe_file(
+                model, audio_file, output_dir, transcription_params, formats,
+                load_hq_model=load_hq_model if two_pass else None,
+                checkpoint_windows=checkpoint_windows,
+                fingerprint_index=fingerprint_index,
+                model_name=model_size
             )
+            subtitle_sources.append(summary['source'])
             
-            srt_filename = f"{audio_file.stem}.srt"
-            srt_path = Path(output_dir) / srt_filename
+            if summary['report']:
+                redecoded_seconds += summary['report']['redecoded_seconds']
+                total_seconds += summary['report']['total_seconds']
+                print(format_report(summary['report']))
             
-            with open(srt_path, "w", encoding="utf-8") as f:
-                f.write(create_srt(result))
-            
-            # 收集置信度信息用于统计
-            file_logprobs = [seg.get("avg_logprob", 0) for seg in result["segments"]]
-            if file_logprobs:
-                file_avg_logprob = sum(file_logprobs) / len(file_logprobs)
-                logprobs.append(file_avg_logprob)
-                print(f"✓ 完成！平均置信度: {file_avg_logprob:.3f}")
+            if summary['source'] == SOURCE_PLATFORM:
+                print("✓ 完成！已直接使用平台字幕，跳过转录")
+            elif summary['source'] == SOURCE_DUPLICATE:
+                print("✓ 完成！已复用重复音频的转录")
+            elif summary['avg_logprob'] is not None:
+                logprobs.append(summary['avg_logprob'])
+                print(f"✓ 完成！平均置信度: {summary['avg_logprob']:.3f}")
             else:
                 print(f"✓ 完成！未获取到置信度数据")
             
-            print(f"字幕已保存到: {srt_path}")
+            for subtitle_path in summary['paths'].values():
+                print(f"字幕已保存到: {subtitle_path}")
+            manifest.mark_completed(audio_file, summary['paths'].values(), settings)
             success_count += 1
             
         except Exception as e:
             print(f"✗ 处理失败: {str(e)}")
             print(f"出错文件: {audio_file.absolute()}")
+            manifest.mark_failed(audio_file, e)
             fail_count += 1
             
         finally:
@@ -139,6 +248,9 @@ def process_mp3_files():
             torch.cuda.empty_cache() if torch.cuda.is_available() else None
             gc.collect()
     
+    if fingerprint_index is not None:
+        fingerprint_index.close()
+    
     # 打印处理统计
     print("\n" + "="*40)
     print(f"处理完成统计:")
@@ -154,10 +266,21 @@ def process_mp3_files():
         print(f"- 最低置信度: {min_logprob:.3f}")
         print(f"- 最高置信度: {max_logprob:.3f}")
     
+    if subtitle_sources:
+        print("\n平台字幕复用统计:")
+        print(f"- {format_source_stats(subtitle_sources)}")
+        if dedup:
+            print(f"- 指纹去重复用: {subtitle_sources.count(SOURCE_DUPLICATE)}/{len(subtitle_sources)}")
+    
+    if two_pass and total_seconds:
+        print("\n两遍转录统计:")
+        print(f"- 重解码音频: {redecoded_seconds:.1f}s / {total_seconds:.1f}s "
+              f"({redecoded_seconds / total_seconds * 100:.1f}%)")
+    
     print(f"\n全部字幕文件保存在: {output_dir}")
+    return success_count, fail_count
 
 if __name__ == "__main__":
-    import gc  # 用于内存清理
     import time
     
     start_time = time.time()
@@ -0,0 +1,170 @@
+import subprocess
+from collections import Counter
+from pathlib import Path
+
+from set_sub import parse_srt_file
+
+# yt-dlp 下载的字幕轨道（--sub-lang zh-Hans,ja），按优先级排列
+TRACK_LANGS = ("ja", "zh-Hans")
+
+# 字幕轨道可直接替代 Whisper 的最低要求
+MIN_TRACK_SEGMENTS = 3
+MIN_TRACK_SPAN = 0.6      # 首尾字幕覆盖的时长占音频时长的比例
+MIN_TRACK_COVERAGE = 0.3  # 各条字幕显示时长之和占音频时长的比例
+MIN_TRACK_DENSITY = 2.0   # 每分钟至少的字幕条数
+MAX_PROMPT_CHARS = 200    # Whisper 提示最多约 224 个 token
+
+# 各种字幕来源的统计：platform=直接使用平台字幕，prompted=字幕作提示，whisper=完整转录
+SOURCE_PLATFORM = "platform"
+SOURCE_PROMPTED = "prompted"
+SOURCE_WHISPER = "whisper"
+
+
+def parse_clock(value):
+    """将 HH:MM:SS / MM:SS / 秒数 转换为秒"""
+    seconds = 0.0
+    for part in str(value).strip().replace(',', '.').split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def probe_duration(media_file):
+    """用 ffprobe 获取媒体时长（秒），失败时返回 None"""
+    command = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        str(media_file)
+    ]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, check=True)
+        return float(result.stdout.strip())
+    except Exception:
+        return None
+
+
+def find_platform_tracks(video_file):
+    """查找 yt-dlp 写在视频旁边的字幕轨道（<标题>.<语言>.srt），按 TRACK_LANGS 排序"""
+    video_file = Path(video_file)
+    tracks = []
+    for lang in TRACK_LANGS:
+        track = video_file.with_name(f"{video_file.stem}.{lang}.srt")
+        if track.exists():
+            tracks.append((lang, track))
+    return tracks
+
+
+def load_track(track_file, clip_start=0.0, clip_end=None):
+    """读取字幕轨道，并裁剪/平移到截取区间的时间轴上"""
+    segments = []
+    for sub in parse_srt_file(track_file):
+        if sub['end'] <= clip_start or (clip_end is not None and sub['start'] >= clip_end):
+            continue
+        start = max(sub['start'], clip_start) - clip_start
+        end = (min(sub['end'], clip_end) if clip_end is not None else sub['end']) - clip_start
+        if end > start:
+            segments.append({'start': start, 'end': end, 'text': sub['text']})
+    return segments
+
+
+def is_usable_track(segments, duration):
+    """判断字幕轨道是否足以直接作为最终字幕
+
+    除首尾跨度外，还要求字幕实际覆盖的时长和字幕密度达标，
+    只在开头、中间、结尾各有一条的稀疏轨道不会跳过转录。
+    时长未知时以最后一条字幕的结束时间代替。
+    """
+    if len(segments) < MIN_TRACK_SEGMENTS:
+        return False
+    duration = duration or segments[-1]['end']
+    if duration <= 0:
+        return False
+
+    span = segments[-1]['end'] - segments[0]['start']
+    # 重叠的字幕只计算一次
+    covered, covered_until = 0.0, 0.0
+    for seg in segments:
+        covered += max(0.0, seg['end'] - max(seg['start'], covered_until))
+        covered_until = max(covered_until, seg['end'])
+    return (
+        span / duration >= MIN_TRACK_SPAN
+        and covered / duration >= MIN_TRACK_COVERAGE
+        and len(segments) / (duration / 60) >= MIN_TRACK_DENSITY
+    )
+
+
+def track_to_result(segments, language):
+    """将字幕轨道包装成与 model.transcribe 相同结构的结果"""
+    return {
+        'language': language,
+        'text': "".join(seg['text'] for seg in segments),
+        'segments': [dict(seg, id=i) for i, seg in enumerate(segments)]
+    }
+
+
+def track_prompt(segments, max_chars=MAX_PROMPT_CHARS):
+    """截取字幕开头的文本作为 initial_prompt"""
+    prompt = ""
+    for seg in segments:
+        if len(prompt) + len(seg['text']) > max_chars:
+            break
+        prompt += seg['text']
+    return prompt
+
+
+def prompted_params(params, prompt):
+    """字幕提示下使用更便宜的贪心解码"""
+    cheap = dict(params, initial_prompt=prompt)
+    cheap.pop('beam_size', None)
+    cheap.pop('best_of', None)
+    # patience 只能配合 beam_size 使用，否则 Whisper 会报错
+    cheap.pop('patience', None)
+    return cheap
+
+
+def plan_from_tracks(video_file, audio_file, language, clip_start=0.0, clip_end=None,
+                     allow_other_language=False):
+    """根据平台字幕决定处理方式
+
+    返回 (来源, 数据)：
+    - (SOURCE_PLATFORM, 结果)   字幕可用，直接跳过转录
+    - (SOURCE_PROMPTED, 提示)   同语言字幕质量不足，仅作为提示
+    - (SOURCE_WHISPER, None)    没有可用字幕
+
+    默认只直接使用与音频同语言的字幕轨道；allow_other_language=True 时
+    其他语言的完整字幕（例如中文翻译）也可以替代转录。
+    """
+    tracks = find_platform_tracks(video_file)
+    if not tracks:
+        return SOURCE_WHISPER, None
+
+    duration = probe_duration(audio_file)
+    prompt = None
+    for lang, track_file in tracks:
+        same_language = lang == language
+        if not same_language and not allow_other_language:
+            continue
+        try:
+            segments = load_track(track_file, clip_start, clip_end)
+        except Exception as e:
+            print(f"读取平台字幕出错 ({track_file.name}): {e}")
+            continue
+        if is_usable_track(segments, duration):
+            print(f"使用平台字幕: {track_file.name}")
+            return SOURCE_PLATFORM, track_to_result(segments, lang)
+        if same_language and segments and prompt is None:
+            prompt = track_prompt(segments)
+
+    if prompt:
+        print("平台字幕不完整，作为提示进行快速转录")
+        return SOURCE_PROMPTED, prompt
+    return SOURCE_WHISPER, None
+
+
+def format_source_stats(sources):
+    """统计跳过推理的任务数，sources 为各任务的字幕来源列表"""
+    counts = Counter(sources)
+    total = len(sources)
+    return (f"平台字幕直接使用(跳过推理): {counts[SOURCE_PLATFORM]}/{total}，"
+            f"字幕提示转录: {counts[SOURCE_PROMPTED]}/{total}，"
+            f"完整转录: {counts[SOURCE_WHISPER]}/{total}")
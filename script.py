@@ -1,18 +1,28 @@
 import subprocess
 import os
 from pathlib import Path
-import whisper
 import warnings
-import torch
 import json
 import gc
 import shutil
+from platform_subs import SOURCE_PLATFORM, SOURCE_PROMPTED, SOURCE_WHISPER, parse_clock, plan_from_tracks, prompted_params, format_source_stats
 
 warnings.filterwarnings("ignore")
 
 FFMPEG_PATH = r"D:\fzwork\ffmpeg-2023-11-05-git-44a0148fad-essentials_build\bin"
 os.environ["PATH"] += os.pathsep + FFMPEG_PATH
 
+def load_whisper_model(model_size=None):
+    """加载 Whisper 模型：GPU 默认 medium，CPU 默认 tiny"""
+    # whisper/torch 启动开销大，只在真正需要模型时导入
+    import whisper
+    import torch
+    
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    if model_size is None:
+        model_size = "medium" if torch.cuda.is_available() else "tiny"
+    return whisper.load_model(model_size, device=device)
+
 class VideoProcessor:
     def __init__(self, source, base_output_dir=None):
         self.source = source
@@ -22,6 +32,10 @@ class VideoProcessor:
         self.video_dir = None
         self.setup_directories()
         self.cut_time_range = None
+        # 平台字幕轨道所在的视频文件，以及截取区间（秒）
+        self.source_video = None
+        self.cut_seconds = (0.0, None)
+        self.subtitle_source = None
 
     def setup_directories(self):
         try:
@@ -51,13 +65,16 @@ class VideoProcessor:
     def get_video_file(self):
         try:
             if self.is_url:
-                return self.download_video_and_thumbnail()
+                self.source_video = self.download_video_and_thumbnail()
+                return self.source_video
             else:
                 # 复制本地文件到工作目录
                 source_path = Path(self.source)
                 dest_path = self.video_dir / source_path.name
                 if not dest_path.exists():  # 如果目标目录中没有该文件，则复制
                     shutil.copy2(source_path, dest_path)
+                # 本地文件的字幕轨道位于原文件旁边
+                self.source_video = str(source_path)
                 return str(dest_path)
         except Exception as e:
             print(f"处理视频文件时出错: {str(e)}")
@@ -97,6 +114,7 @@ class VideoProcessor:
             output_filename = f"{Path(input_video).stem}_cut"
             output_video = time_dir / f"{output_filename}.mp4"
             self.cut_time_range = time_str
+            self.cut_seconds = (parse_clock(start_time), parse_clock(end_time) if end_time else None)
 
             command = [
                 os.path.join(FFMPEG_PATH, "ffmpeg"),
@@ -126,7 +144,8 @@ class VideoProcessor:
             print(f"截取视频出错: {str(e)}")
             return None
 
-    def extract_audio(self, input_video):
+    @staticmethod
+    def extract_audio(input_video):
         try:
             output_dir = Path(input_video).parent
             output_filename = Path(input_video).stem
@@ -149,14 +168,52 @@ class VideoProcessor:
             print(f"提取音频出错: {str(e)}")
             return None
 
-    def generate_subtitle(self, audio_file):
+    def generate_subtitle(self, audio_file, formats=("srt",), model=None):
+        import torch
+        from audio_cache import load_cached_audio
+        from subtitle_export import write_subtitles
+        from checkpoint import checkpoint_path, transcribe_with_checkpoints
+        from fingerprint import INDEX_NAME, SOURCE_DUPLICATE, FingerprintIndex, compute_fingerprint
+        
+        fingerprint_index = None
         try:
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            model_size = "medium" if torch.cuda.is_available() else "tiny"
-            model = whisper.load_model(model_size, device=device)
+            output_dir = self.video_dir
+            if self.cut_time_range:
+                output_dir = output_dir / self.cut_time_range
+                output_dir.mkdir(exist_ok=True, parents=True)
+            
+            language = "ja"
+            self.subtitle_source, hint = SOURCE_WHISPER, None
+            if self.source_video:
+                self.subtitle_source, hint = plan_from_tracks(
+                    self.source_video, audio_file, language, *self.cut_seconds
+                )
+            
+            # 平台字幕足够好时直接输出，不加载模型
+            if self.subtitle_source == SOURCE_PLATFORM:
+                subtitle_paths = write_subtitles(hint, output_dir, Path(audio_file).stem, formats)
+                return str(next(iter(subtitle_paths.values())))
+            
+            # 同一视频的不同截取/重复运行共用 PCM 缓存
+            audio = load_cached_audio(audio_file, self.video_dir / ".pcm_cache")
+            
+            # 重新上传/转码的相同内容直接复用已有转录，时间戳按偏移平移
+            fingerprint_index = FingerprintIndex(self.base_output_dir / INDEX_NAME)
+            fingerprint = compute_fingerprint(audio)
+            match = fingerprint_index.find_match(fingerprint, exclude_path=Path(audio_file).absolute())
+            if match:
+                print(f"检测到重复音频: {Path(match['path']).name}（偏移 {match['start']:.2f}s），复用已有转录")
+                self.subtitle_source = SOURCE_DUPLICATE
+                result = fingerprint_index.reuse_transcript(match, fingerprint.duration)
+                subtitle_paths = write_subtitles(result, output_dir, Path(audio_file).stem, formats)
+                return str(next(iter(subtitle_paths.values())))
+            
+            # 常驻服务会传入已加载的模型，避免每次冷启动
+            if model is None:
+                model = load_whisper_model()
             
             transcription_params = {
-                'language': "ja",
+                'language': language,
                 'fp16': torch.cuda.is_available(),
                 'temperature': 0.0,
                 'beam_size': 5,
@@ -164,41 +221,30 @@ class VideoProcessor:
                 'word_timestamps': True,
                 'initial_prompt': "日语音频转录。"
             }
+            if self.subtitle_source == SOURCE_PROMPTED:
+                transcription_params = prompted_params(transcription_params, hint)
             
-            result = model.transcribe(audio_file, **transcription_params)
-            
-            output_dir = self.video_dir
-            if self.cut_time_range:
-                output_dir = output_dir / self.cut_time_range
-                output_dir.mkdir(exist_ok=True, parents=True)
-            
-            srt_path = output_dir / f"{Path(audio_file).stem}.srt"
+            # 定期保存检查点，进程中断后重新运行可从断点继续
+            result = transcribe_with_checkpoints(
+                model, audio, transcription_params,
+                checkpoint_path(output_dir, Path(audio_file).stem)
+            )
             
-            with open(srt_path, "w", encoding="utf-8") as f:
-                segments = []
-                for i, segment in enumerate(result["segments"], start=1):
-                    start = self.format_timestamp(segment["start"])
-                    end = self.format_timestamp(segment["end"])
-                    text = segment["text"].strip()
-                    segments.append(f"{i}\n{start} --> {end}\n{text}\n")
-                f.write("\n".join(segments))
+            subtitle_paths = write_subtitles(result, output_dir, Path(audio_file).stem, formats)
+            fingerprint_index.add(Path(audio_file).absolute(), fingerprint, result)
             
-            return str(srt_path)
+            # 返回第一个请求格式的路径，保持与旧版只输出SRT时一致
+            return str(next(iter(subtitle_paths.values())))
         except Exception as e:
             print(f"生成字幕时出错: {str(e)}")
             return None
         finally:
+            if fingerprint_index is not None:
+                fingerprint_index.close()
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
             gc.collect()
 
-    @staticmethod
-    def format_timestamp(seconds):
-        total_seconds = int(seconds)
-        hours, remainder = divmod(total_seconds, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d},000"
-
 def main():
     try:
         print("\n=== 视频处理工具 ===")
@@ -231,6 +277,8 @@ def main():
             if audio_file:
                 processor.generate_subtitle(audio_file)
         
+        if processor.subtitle_source:
+            print(format_source_stats([processor.subtitle_source]))
         print(f"\n处理完成！文件保存在: {processor.video_dir}")
         
     except Exception as e:
@@ -6,12 +6,15 @@ import tempfile
 import re
 FFMPEG_PATH = r"D:\fzwork\ffmpeg-2023-11-05-git-44a0148fad-essentials_build\bin"
 os.environ["PATH"] += os.pathsep + FFMPEG_PATH
+
+# 支持的视频格式
+VIDEO_EXTENSIONS = {'.mp4', '.mkv', '.avi', '.mov', '.wmv'}
+# 支持的字幕格式
+SUBTITLE_EXTENSIONS = {'.srt', '.ass', '.ssa'}
+# 合并结果的文件名后缀
+OUTPUT_SUFFIX = "_with_subtitle"
+
 def find_matching_files(directory):
-    # 支持的视频格式
-    video_extensions = {'.mp4', '.mkv', '.avi', '.mov', '.wmv'}
-    # 支持的字幕格式
-    subtitle_extensions = {'.srt', '.ass', '.ssa'}
-    
     videos = []
     subtitles = []
     
@@ -20,9 +23,9 @@ def find_matching_files(directory):
         path = os.path.join(directory, file)
         if os.path.isfile(path):
             ext = os.path.splitext(file)[1].lower()
-            if ext in video_extensions:
+            if ext in VIDEO_EXTENSIONS:
                 videos.append(path)
-            elif ext in subtitle_extensions:
+            elif ext in SUBTITLE_EXTENSIONS:
                 subtitles.append(path)
     
     # 匹配视频和字幕文件
@@ -228,6 +231,35 @@ def merge_video_subtitle_batch(video_path, subtitles, output_path):
         print(f"分批处理错误: {str(e)}")
         return False
 
+def mux_video_subtitle(video_path, subtitle_path, output_path, language=None):
+    """将字幕作为软字幕轨道封装进视频（不重新编码）"""
+    try:
+        output_ext = os.path.splitext(output_path)[1].lower()
+        # MP4/MOV 只支持 mov_text，MKV 可直接保留 SRT/ASS
+        subtitle_codec = 'mov_text' if output_ext in ('.mp4', '.m4v', '.mov') else 'copy'
+        
+        cmd = [
+            'ffmpeg',
+            '-i', video_path,
+            '-i', subtitle_path,
+            '-map', '0:v', '-map', '0:a?', '-map', '1:0',
+            '-c:v', 'copy',
+            '-c:a', 'copy',
+            '-c:s', subtitle_codec
+        ]
+        if language:
+            cmd.extend(['-metadata:s:s:0', f'language={language}'])
+        cmd.extend([output_path, '-y'])
+        
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        if result.returncode != 0:
+            print(f"FFmpeg错误: {result.stderr}")
+            return False
+        return True
+    except Exception as e:
+        print(f"封装字幕错误: {str(e)}")
+        return False
+
 def safe_filename(filename):
     """生成安全的文件名"""
     unsafe_chars = ['/', '\\', ':', '*', '?', '"', '<', '>', '|', '⧸']
@@ -263,7 +295,7 @@ def main():
         # 创建输出文件名
         video_name = os.path.splitext(os.path.basename(video_path))[0]
         safe_name = safe_filename(video_name)
-        output_path = os.path.join(directory, f"{safe_name}_with_subtitle.mp4")
+        output_path = os.path.join(directory, f"{safe_name}{OUTPUT_SUFFIX}.mp4")
         
         print(f"\n[{i}/{len(matches)}] 处理文件: {video_name}")
         print(f"视频: {os.path.basename(video_path)}")
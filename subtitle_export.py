@@ -0,0 +1,155 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+# 支持的导出格式（扩展名即格式名）
+SUPPORTED_FORMATS = ("srt", "vtt", "ass", "json")
+
+ASS_HEADER = """[Script Info]
+ScriptType: v4.00+
+PlayResX: 1920
+PlayResY: 1080
+WrapStyle: 0
+ScaledBorderAndShadow: yes
+
+[V4+ Styles]
+Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, Alignment, MarginL, MarginR, MarginV, Encoding
+Style: Default,Arial,60,&H00FFFFFF,&H000000FF,&H00000000,&H80000000,0,0,0,0,100,100,0,0,1,2,1,2,20,20,40,1
+
+[Events]
+Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text
+"""
+
+
+def _split_clock(seconds):
+    """将秒数组拆分为 时/分/秒/毫秒 四个整数数组（按毫秒四舍五入）"""
+    ms = np.rint(np.asarray(seconds, dtype=np.float64) * 1000).astype(np.int64)
+    ms = np.maximum(ms, 0)
+    hours, rem = np.divmod(ms, 3_600_000)
+    minutes, rem = np.divmod(rem, 60_000)
+    secs, millis = np.divmod(rem, 1000)
+    return hours, minutes, secs, millis
+
+
+def _join_clock(hours, minutes, secs, frac, hour_width, frac_sep, frac_width):
+    template = f"{{:0{hour_width}d}}:{{:02d}}:{{:02d}}{frac_sep}{{:0{frac_width}d}}"
+    fmt = template.format
+    return [fmt(*parts) for parts in zip(hours.tolist(), minutes.tolist(), secs.tolist(), frac.tolist())]
+
+
+def format_timestamps(seconds, frac_sep=","):
+    """批量格式化为 HH:MM:SS,mmm（frac_sep='.' 时为 WebVTT 格式）"""
+    if len(seconds) == 0:
+        return []
+    hours, minutes, secs, millis = _split_clock(seconds)
+    return _join_clock(hours, minutes, secs, millis, 2, frac_sep, 3)
+
+
+def format_ass_timestamps(seconds):
+    """批量格式化为 ASS 使用的 H:MM:SS.cc（百分之一秒）"""
+    if len(seconds) == 0:
+        return []
+    centis = np.rint(np.asarray(seconds, dtype=np.float64) * 100) / 100
+    hours, minutes, secs, millis = _split_clock(centis)
+    return _join_clock(hours, minutes, secs, millis // 10, 1, ".", 2)
+
+
+def format_timestamp(seconds):
+    """单个时间戳转换为 SRT 格式"""
+    return format_timestamps([seconds])[0]
+
+
+def _escape_vtt(text):
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _escape_ass(text):
+    return text.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}").replace("\n", "\\N")
+
+
+def render_subtitles(result, formats=("srt",)):
+    """一次遍历 Whisper 结果，同时生成所有请求的字幕格式文本
+
+    返回 {格式: 文本}。
+    """
+    formats = tuple(dict.fromkeys(fmt.lower() for fmt in formats))
+    unknown = [fmt for fmt in formats if fmt not in SUPPORTED_FORMATS]
+    if unknown:
+        raise ValueError(f"不支持的字幕格式: {', '.join(unknown)}")
+
+    segments = result["segments"]
+    count = len(segments)
+    starts = np.fromiter((seg["start"] for seg in segments), dtype=np.float64, count=count)
+    ends = np.fromiter((seg["end"] for seg in segments), dtype=np.float64, count=count)
+
+    want_srt = "srt" in formats
+    want_vtt = "vtt" in formats
+    want_ass = "ass" in formats
+    want_json = "json" in formats
+
+    # 时间戳在遍历前一次性向量化生成
+    srt_starts = format_timestamps(starts) if want_srt else None
+    srt_ends = format_timestamps(ends) if want_srt else None
+    vtt_starts = format_timestamps(starts, ".") if want_vtt else None
+    vtt_ends = format_timestamps(ends, ".") if want_vtt else None
+    ass_starts = format_ass_timestamps(starts) if want_ass else None
+    ass_ends = format_ass_timestamps(ends) if want_ass else None
+    ms_starts = (np.rint(starts * 1000) / 1000).tolist() if want_json else None
+    ms_ends = (np.rint(ends * 1000) / 1000).tolist() if want_json else None
+
+    srt_blocks, vtt_blocks, ass_lines, json_segments = [], [], [], []
+    for i, segment in enumerate(segments):
+        text = segment["text"].strip()
+        if want_srt:
+            srt_blocks.append(f"{i + 1}\n{srt_starts[i]} --> {srt_ends[i]}\n{text}\n")
+        if want_vtt:
+            vtt_blocks.append(f"{vtt_starts[i]} --> {vtt_ends[i]}\n{_escape_vtt(text)}\n")
+        if want_ass:
+            ass_lines.append(f"Dialogue: 0,{ass_starts[i]},{ass_ends[i]},Default,,0,0,0,,{_escape_ass(text)}\n")
+        if want_json:
+            json_segments.append({
+                "id": i,
+                "start": ms_starts[i],
+                "end": ms_ends[i],
+                "text": text
+            })
+
+    rendered = {}
+    if want_srt:
+        rendered["srt"] = "\n".join(srt_blocks)
+    if want_vtt:
+        rendered["vtt"] = "WEBVTT\n\n" + "\n".join(vtt_blocks)
+    if want_ass:
+        rendered["ass"] = ASS_HEADER + "".join(ass_lines)
+    if want_json:
+        rendered["json"] = json.dumps({
+            "language": result.get("language"),
+            "text": result.get("text", "").strip(),
+            "segments": json_segments
+        }, ensure_ascii=False)
+    return rendered
+
+
+def _write_text(path, content):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return path
+
+
+def write_subtitles(result, output_dir, stem, formats=("srt",)):
+    """渲染并并发写出所有格式，返回 {格式: 文件路径}"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rendered = render_subtitles(result, formats)
+
+    paths = {fmt: output_dir / f"{stem}.{fmt}" for fmt in rendered}
+    workers = min(len(rendered), os.cpu_count() or 1) or 1
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            fmt: executor.submit(_write_text, paths[fmt], content)
+            for fmt, content in rendered.items()
+        }
+        return {fmt: future.result() for fmt, future in futures.items()}
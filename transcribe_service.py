@@ -0,0 +1,340 @@
+"""常驻本地转录服务
+
+模型只加载一次并保持常驻，任务通过 HTTP 提交后按优先级排队处理：
+
+    python transcribe_service.py --port 8765 --preload tiny
+
+    POST /jobs              提交任务 {"source", "start", "end", "formats", "model", "priority", "wait"}
+    GET  /jobs/<id>         查询任务状态
+    GET  /jobs/<id>/events  按行流式返回进度（JSON Lines），任务结束时关闭连接
+    GET  /stats             吞吐量与队列深度统计
+"""
+import argparse
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from script import VideoProcessor, load_whisper_model
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_PRIORITY = 10  # 数值越小越先处理
+
+# 已结束任务的保留策略，避免常驻服务的任务表无限增长
+JOB_RETENTION_SECONDS = 3600
+MAX_FINISHED_JOBS = 1000
+
+
+class ModelPool:
+    """按模型大小缓存已加载的 Whisper 模型
+
+    解码器的 kv-cache 钩子挂在模型上，同一模型不能被多个线程同时用于转录，
+    因此每个模型配一把锁，转录时持有。
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.loading = {}   # 模型大小 -> 加载锁，同一模型只加载一次
+        self.lock = threading.Lock()
+
+    def get(self, model_size=None):
+        """返回 (模型, 该模型的转录锁)
+
+        加载在池锁之外进行，加载大模型时不会阻塞统计查询和使用其他模型的任务。
+        """
+        key = model_size or "default"
+        with self.lock:
+            if key in self.models:
+                return self.models[key]
+            load_lock = self.loading.setdefault(key, threading.Lock())
+        with load_lock:
+            with self.lock:
+                if key in self.models:
+                    return self.models[key]
+            print(f"加载模型: {key}")
+            entry = (load_whisper_model(model_size), threading.Lock())
+            with self.lock:
+                self.models[key] = entry
+                self.loading.pop(key, None)
+            return entry
+
+    def loaded(self):
+        with self.lock:
+            return sorted(self.models)
+
+
+class Job:
+    def __init__(self, params):
+        self.id = uuid.uuid4().hex[:12]
+        self.params = params
+        self.priority = int(params.get('priority', DEFAULT_PRIORITY))
+        self.status = "queued"
+        self.outputs = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.events = []
+        self.cond = threading.Condition()
+        self.emit("queued")
+
+    def emit(self, stage, **detail):
+        with self.cond:
+            self.events.append(dict(stage=stage, time=time.time(), **detail))
+            self.cond.notify_all()
+
+    def finish(self, status, error=None):
+        """状态与最后一个事件同时更新，保证流式读取不会漏掉结束事件"""
+        with self.cond:
+            self.status = status
+            self.error = error
+            self.finished = time.time()
+            self.events.append(dict(stage=status, time=self.finished, error=error))
+            self.cond.notify_all()
+
+    @property
+    def done(self):
+        return self.status in ("done", "failed")
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'status': self.status,
+            'priority': self.priority,
+            'params': self.params,
+            'outputs': self.outputs,
+            'error': self.error,
+            'created': self.created,
+            'started': self.started,
+            'finished': self.finished,
+            'stage': self.events[-1]['stage'] if self.events else None
+        }
+
+
+class TranscriptionService:
+    """优先级任务队列 + 常驻模型的工作线程"""
+
+    def __init__(self, output_dir=None, workers=1):
+        self.output_dir = output_dir
+        self.models = ModelPool()
+        self.queue = queue.PriorityQueue()
+        self.jobs = {}
+        self.jobs_lock = threading.Lock()
+        self.counter = itertools.count()
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.started = time.time()
+        self.workers = [
+            threading.Thread(target=self.worker_loop, name=f"worker-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self.workers:
+            worker.start()
+
+    def submit(self, params):
+        if not isinstance(params, dict):
+            raise ValueError("请求体必须是 JSON 对象")
+        if not params.get('source'):
+            raise ValueError("缺少 source 参数")
+        job = Job(params)
+        with self.jobs_lock:
+            self.prune_jobs()
+            self.jobs[job.id] = job
+        # 序号保证同优先级按提交顺序处理
+        self.queue.put((job.priority, next(self.counter), job.id))
+        return job
+
+    def get(self, job_id):
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def prune_jobs(self):
+        """删除超过保留时间的已结束任务，数量超过上限时再删除最早结束的（调用方持有 jobs_lock）"""
+        now = time.time()
+        finished = sorted(
+            (job.finished, job_id) for job_id, job in self.jobs.items()
+            if job.done and job.finished is not None
+        )
+        expired = [job_id for ended, job_id in finished if now - ended > JOB_RETENTION_SECONDS]
+        overflow = [job_id for _, job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]]
+        for job_id in set(expired) | set(overflow):
+            del self.jobs[job_id]
+
+    def worker_loop(self):
+        while True:
+            _, _, job_id = self.queue.get()
+            job = self.get(job_id)
+            with self.jobs_lock:
+                self.running += 1
+            try:
+                self.run_job(job)
+            finally:
+                with self.jobs_lock:
+                    self.running -= 1
+                self.queue.task_done()
+
+    def run_job(self, job):
+        params = job.params
+        job.status = "running"
+        job.started = time.time()
+        status, error = "failed", None
+        try:
+            job.emit("loading_model")
+            model, model_lock = self.models.get(params.get('model'))
+
+            processor = VideoProcessor(params['source'], self.output_dir)
+            job.emit("fetching")
+            video_file = processor.get_video_file()
+            if not video_file:
+                raise RuntimeError("获取视频失败")
+
+            if params.get('start') or params.get('end'):
+                job.emit("cutting")
+                video_file = processor.cut_video(video_file, params.get('start') or "00:00:00", params.get('end'))
+                if not video_file:
+                    raise RuntimeError("截取视频失败")
+
+            job.emit("extracting_audio")
+            audio_file = processor.extract_audio(video_file)
+            if not audio_file:
+                raise RuntimeError("提取音频失败")
+
+            job.emit("transcribing")
+            formats = tuple(params.get('formats') or ("srt",))
+            with model_lock:
+                subtitle = processor.generate_subtitle(audio_file, formats, model=model)
+            if not subtitle:
+                raise RuntimeError("生成字幕失败")
+
+            job.outputs = {
+                'subtitle': subtitle,
+                'subtitle_source': processor.subtitle_source,
+                'video_dir': str(processor.video_dir)
+            }
+            status = "done"
+        except Exception as e:
+            error = str(e)
+        finally:
+            with self.jobs_lock:
+                if status == "done":
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self.busy_seconds += time.time() - job.started
+            job.finish(status, error)
+
+    def stats(self):
+        with self.jobs_lock:
+            finished = self.completed + self.failed
+            uptime = time.time() - self.started
+            return {
+                'queue_depth': self.queue.qsize(),
+                'running': self.running,
+                'completed': self.completed,
+                'failed': self.failed,
+                'uptime_seconds': round(uptime, 1),
+                'jobs_per_minute': round(finished / uptime * 60, 3) if uptime else 0.0,
+                'avg_job_seconds': round(self.busy_seconds / finished, 2) if finished else None,
+                'workers': len(self.workers),
+                'loaded_models': self.models.loaded()
+            }
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/jobs":
+                return self.send_json(404, {'error': "not found"})
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                params = json.loads(self.rfile.read(length) or b"{}")
+                job = service.submit(params)
+            except (ValueError, TypeError) as e:
+                return self.send_json(400, {'error': str(e)})
+
+            if params.get('wait'):
+                with job.cond:
+                    job.cond.wait_for(lambda: job.done)
+                return self.send_json(200, job.to_dict())
+            self.send_json(202, job.to_dict())
+
+        def do_GET(self):
+            parts = [p for p in self.path.split("?")[0].split("/") if p]
+            if parts == ["stats"]:
+                return self.send_json(200, service.stats())
+            if len(parts) >= 2 and parts[0] == "jobs":
+                job = service.get(parts[1])
+                if job is None:
+                    return self.send_json(404, {'error': "job not found"})
+                if len(parts) == 2:
+                    return self.send_json(200, job.to_dict())
+                if parts[2:] == ["events"]:
+                    return self.stream_events(job)
+            self.send_json(404, {'error': "not found"})
+
+        def stream_events(self, job):
+            """逐行推送进度事件，直到任务结束"""
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+            self.end_headers()
+            sent = 0
+            while True:
+                with job.cond:
+                    job.cond.wait_for(lambda: len(job.events) > sent or job.done, timeout=15)
+                    pending = job.events[sent:]
+                    finished = job.done and sent + len(pending) == len(job.events)
+                try:
+                    for event in pending:
+                        self.wfile.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                sent += len(pending)
+                if finished:
+                    return
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻本地转录服务")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=1, help="并行处理任务的线程数（使用同一模型的转录会排队执行）")
+    parser.add_argument("--output-dir", default=None, help="输出根目录，默认 video_output")
+    parser.add_argument("--preload", default="", help="启动时预加载的模型，逗号分隔；'default' 表示按设备选择")
+    args = parser.parse_args()
+
+    service = TranscriptionService(args.output_dir, args.workers)
+    for model_size in filter(None, args.preload.split(",")):
+        service.models.get(None if model_size == "default" else model_size)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(service))
+    print(f"转录服务已启动: http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n服务已停止")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
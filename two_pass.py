@@ -0,0 +1,141 @@
+import numpy as np
+
+from audio_cache import SAMPLE_RATE, audio_duration
+
+# 判定草稿片段需要重新解码的阈值
+DEFAULT_REDO_THRESHOLDS = {
+    'logprob_threshold': -0.8,           # avg_logprob 低于此值
+    'compression_ratio_threshold': 2.2,  # compression_ratio 高于此值（疑似重复/幻觉）
+    'no_speech_threshold': 0.5           # no_speech_prob 高于此值
+}
+
+# 第二遍使用的高质量参数（覆盖草稿参数）
+HQ_OVERRIDES = {
+    'beam_size': 5,
+    'best_of': 5,
+    'patience': 1.0
+}
+
+
+def needs_redo(segment, thresholds=DEFAULT_REDO_THRESHOLDS):
+    """判断单个草稿片段是否越过任一置信度阈值"""
+    return (
+        segment.get("avg_logprob", 0.0) < thresholds['logprob_threshold']
+        or segment.get("compression_ratio", 0.0) > thresholds['compression_ratio_threshold']
+        or segment.get("no_speech_prob", 0.0) > thresholds['no_speech_threshold']
+    )
+
+
+def find_redo_spans(segments, duration, thresholds=DEFAULT_REDO_THRESHOLDS,
+                    padding=0.3, merge_gap=1.0):
+    """找出需要重解码的时间区间
+
+    相邻（间隔小于 merge_gap 秒）的低置信度片段合并为一个区间，
+    两端各留最多 padding 秒余量。返回 [(开始秒, 结束秒, 首片段下标, 末片段下标)]。
+    """
+    spans = []
+    for i, segment in enumerate(segments):
+        if not needs_redo(segment, thresholds):
+            continue
+        # 余量只延伸到相邻片段的边界，避免重复识别已保留的内容
+        lower = segments[i - 1]["end"] if i > 0 else 0.0
+        upper = segments[i + 1]["start"] if i + 1 < len(segments) else duration
+        start = max(lower, segment["start"] - padding)
+        end = min(max(upper, segment["end"]), segment["end"] + padding)
+        if spans and start - spans[-1][1] <= merge_gap:
+            prev_start, _, first, _ = spans[-1]
+            spans[-1] = (prev_start, max(end, spans[-1][1]), first, i)
+        else:
+            spans.append((start, end, i, i))
+    return spans
+
+
+def shift_segment(segment, offset, limit=None):
+    """将片段（及词级时间戳）平移 offset 秒，并可选地截断到 limit"""
+    def clamp(t):
+        return min(limit, t) if limit is not None else t
+
+    segment = dict(segment)
+    segment["start"] = clamp(offset + segment["start"])
+    segment["end"] = clamp(offset + segment["end"])
+    if segment.get("words"):
+        segment["words"] = [
+            dict(word, start=clamp(offset + word["start"]), end=clamp(offset + word["end"]))
+            for word in segment["words"]
+        ]
+    return segment
+
+
+def redecode_span(model, audio, start, end, params):
+    """对 [start, end) 区间的音频重新转录，返回已平移到全局时间轴的片段"""
+    clip = np.ascontiguousarray(audio[int(start * SAMPLE_RATE):int(end * SAMPLE_RATE)])
+    result = model.transcribe(clip, **params)
+    segments = []
+    for segment in result["segments"]:
+        segment = shift_segment(segment, start, end)
+        if segment["end"] > segment["start"] and segment["text"].strip():
+            segments.append(segment)
+    return segments
+
+
+def two_pass_transcribe(draft_model, load_hq_model, audio, draft_params,
+                        thresholds=DEFAULT_REDO_THRESHOLDS, hq_overrides=HQ_OVERRIDES):
+    """两遍转录：先用快速模型出草稿，再只对低置信度片段用大模型重解码
+
+    load_hq_model 为无参可调用对象，只有确实存在需要重做的片段时才会加载大模型。
+    返回 (拼接后的结果, 统计报告)。
+    """
+    draft = draft_model.transcribe(audio, **draft_params)
+    return refine_draft(draft, load_hq_model, audio, draft_params, thresholds, hq_overrides)
+
+
+def refine_draft(draft, load_hq_model, audio, draft_params,
+                 thresholds=DEFAULT_REDO_THRESHOLDS, hq_overrides=HQ_OVERRIDES):
+    """对已有草稿执行第二遍：重解码低置信度片段并拼接回去"""
+    segments = draft["segments"]
+    duration = audio_duration(audio)
+    spans = find_redo_spans(segments, duration, thresholds)
+
+    report = {
+        'total_seconds': duration,
+        'redecoded_seconds': 0.0,
+        'draft_segments': len(segments),
+        'redone_segments': 0,
+        'spans': len(spans)
+    }
+    if not spans:
+        return draft, report
+
+    hq_model = load_hq_model()
+    hq_params = dict(draft_params, **hq_overrides)
+    base_prompt = draft_params.get('initial_prompt') or ""
+
+    merged = []
+    cursor = 0
+    for start, end, first, last in spans:
+        merged.extend(segments[cursor:first])
+        # 用前一句已确认的文本作为提示，保持上下文连贯
+        previous_text = merged[-1]["text"].strip() if merged else ""
+        span_params = dict(hq_params, initial_prompt=(base_prompt + previous_text) or None)
+
+        redone = redecode_span(hq_model, audio, start, end, span_params)
+        # 大模型也没有识别出内容时保留草稿
+        merged.extend(redone if redone else segments[first:last + 1])
+
+        report['redecoded_seconds'] += end - start
+        report['redone_segments'] += last - first + 1
+        cursor = last + 1
+    merged.extend(segments[cursor:])
+
+    for i, segment in enumerate(merged):
+        segment["id"] = i
+    result = dict(draft, segments=merged, text="".join(seg["text"] for seg in merged))
+    return result, report
+
+
+def format_report(report):
+    """生成重解码比例的简短说明"""
+    total = report['total_seconds']
+    ratio = report['redecoded_seconds'] / total * 100 if total else 0.0
+    return (f"重解码 {report['redone_segments']}/{report['draft_segments']} 个片段，"
+            f"{report['redecoded_seconds']:.1f}s/{total:.1f}s 音频 ({ratio:.1f}%)")
@@ -0,0 +1,293 @@
+"""目录监视模式：持续处理新到达或被修改的媒体文件
+
+Linux 上使用 inotify（通过 ctypes 调用，无额外依赖），其他平台退回到定时轮询。
+文件需在 debounce 秒内没有新事件、且大小和修改时间不再变化才会被分发，
+已处理的文件及其大小/修改时间保存在状态文件中，重启后不会重复处理。
+
+    python cli.py watch D:\\ingest --mode transcribe --output-dir D:\\ingest\\srt_output
+    python cli.py watch D:\\ingest --mode merge
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from json_store import read_json, write_json_atomic
+from set_sub import OUTPUT_SUFFIX, SUBTITLE_EXTENSIONS, VIDEO_EXTENSIONS
+
+AUDIO_EXTENSIONS = {'.mp3', '.m4a', '.wav', '.flac'}
+STATE_NAME = ".watch_state.json"
+
+DEFAULT_DEBOUNCE = 5.0   # 最后一次事件之后等待的秒数
+DEFAULT_INTERVAL = 2.0   # 轮询模式的扫描间隔
+
+# inotify 事件掩码（见 <sys/inotify.h>）
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+def list_files(directory):
+    """列出目录下的普通文件（不递归）"""
+    with os.scandir(directory) as entries:
+        return {entry.path for entry in entries if entry.is_file()}
+
+
+def file_signature(path):
+    """文件的 (大小, 修改时间)，文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class InotifyWatcher:
+    """基于 inotify 的目录监视，只返回发生变化的文件"""
+
+    def __init__(self, directory):
+        self.directory = str(directory)
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(self.fd, self.directory.encode(), mask) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch 失败")
+        # 启动时扫描一次，处理离线期间到达的文件
+        self.initial = list_files(self.directory)
+
+    def poll(self, timeout):
+        if self.initial is not None:
+            changed, self.initial = self.initial, None
+            return changed
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        data = os.read(self.fd, 64 * 1024)
+        changed = set()
+        pos = 0
+        while pos < len(data):
+            _, mask, _, name_len = INOTIFY_EVENT.unpack_from(data, pos)
+            pos += INOTIFY_EVENT.size
+            name = data[pos:pos + name_len].rstrip(b"\0").decode(errors="surrogateescape")
+            pos += name_len
+            if mask & IN_Q_OVERFLOW:
+                # 事件队列溢出时退回到一次全量扫描
+                changed |= list_files(self.directory)
+            elif name:
+                changed.add(os.path.join(self.directory, name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """定时扫描目录，对比大小和修改时间找出变化的文件"""
+
+    def __init__(self, directory, interval=DEFAULT_INTERVAL):
+        self.directory = str(directory)
+        self.interval = interval
+        self.snapshot = {}
+        self.scanned = False
+
+    def poll(self, timeout):
+        # 第一次立即扫描；之后即使目录为空也要等待，避免空转
+        if self.scanned:
+            time.sleep(min(timeout, self.interval))
+        current = {path: file_signature(path) for path in list_files(self.directory)}
+        changed = {path for path, sig in current.items() if self.snapshot.get(path) != sig}
+        self.snapshot = current
+        self.scanned = True
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(directory, interval=DEFAULT_INTERVAL, force_polling=False):
+    if sys.platform.startswith("linux") and not force_polling:
+        try:
+            return InotifyWatcher(directory)
+        except OSError as e:
+            print(f"inotify 不可用，改用轮询: {e}")
+    return PollingWatcher(directory, interval)
+
+
+class WatchState:
+    """已处理文件的持久化记录：{路径: 签名}"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.processed = read_json(self.path) or {}
+        self.lock = threading.Lock()
+
+    def is_processed(self, key, signature):
+        with self.lock:
+            return self.processed.get(key) == signature
+
+    def mark(self, key, signature):
+        with self.lock:
+            self.processed[key] = signature
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            write_json_atomic(self.path, self.processed)
+
+
+# ---- 转录任务（在子进程中运行，每个进程只加载一次模型） ----
+
+_worker = {}
+
+
+def _init_transcribe_worker(model_size, language, formats, index_path):
+    import whisper
+    from main import optimize_transcription_settings
+    params = optimize_transcription_settings()
+    if language:
+        params['language'] = language
+    _worker.update(model=whisper.load_model(model_size, device="cpu"), model_size=model_size,
+                   params=params, formats=formats)
+    if index_path:
+        from fingerprint import FingerprintIndex
+        _worker['index'] = FingerprintIndex(index_path)
+
+
+def _transcribe_job(audio_file, output_dir):
+    from main import transcribe_file
+    summary = transcribe_file(
+        _worker['model'], audio_file, output_dir, _worker['params'], _worker['formats'],
+        fingerprint_index=_worker.get('index'), model_name=_worker['model_size']
+    )
+    return [str(p) for p in summary['paths'].values()]
+
+
+class TranscribeTarget:
+    """新到达的音频 -> 字幕"""
+
+    extensions = AUDIO_EXTENSIONS
+
+    def __init__(self, output_dir, workers=1, model_size="tiny", language=None, formats=("srt",),
+                 dedup=True):
+        # fingerprint 依赖 numpy，只在转录模式导入，合并模式保持轻量启动
+        from fingerprint import INDEX_NAME
+        self.output_dir = str(output_dir)
+        index_path = os.path.join(self.output_dir, INDEX_NAME) if dedup else None
+        self.executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_transcribe_worker,
+            initargs=(model_size, language, tuple(formats), index_path)
+        )
+
+    def resolve(self, path):
+        """返回 (状态键, 签名列表)，不需要处理时返回 None"""
+        if Path(path).suffix.lower() not in self.extensions:
+            return None
+        return path, [file_signature(path)]
+
+    def submit(self, key):
+        return self.executor.submit(_transcribe_job, key, self.output_dir)
+
+
+class MergeTarget:
+    """视频与同名字幕都到齐后烧录字幕"""
+
+    extensions = VIDEO_EXTENSIONS | SUBTITLE_EXTENSIONS
+
+    def __init__(self, output_dir=None, workers=1):
+        self.output_dir = output_dir
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def resolve(self, path):
+        path = Path(path)
+        if path.suffix.lower() not in self.extensions or path.stem.endswith(OUTPUT_SUFFIX):
+            return None
+        videos = [p for p in (path.with_suffix(ext) for ext in VIDEO_EXTENSIONS) if p.exists()]
+        subtitles = [p for p in (path.with_suffix(ext) for ext in SUBTITLE_EXTENSIONS) if p.exists()]
+        if not videos or not subtitles:
+            return None
+        video, subtitle = str(videos[0]), str(subtitles[0])
+        # 视频或字幕任一变化都需要重新合并
+        return f"{video}|{subtitle}", [file_signature(video), file_signature(subtitle)]
+
+    def submit(self, key):
+        from set_sub import merge_video_subtitle, safe_filename
+        video, subtitle = key.split("|")
+        output_dir = self.output_dir or os.path.dirname(video)
+        output = os.path.join(output_dir, f"{safe_filename(Path(video).stem)}{OUTPUT_SUFFIX}.mp4")
+
+        def job():
+            if not merge_video_subtitle(video, subtitle, output):
+                raise RuntimeError("合并失败")
+            return [output]
+        return self.executor.submit(job)
+
+
+def watch(directory, target, state_file, debounce=DEFAULT_DEBOUNCE,
+          interval=DEFAULT_INTERVAL, force_polling=False):
+    """监视目录并把稳定下来的新文件分发给 target 的工作池，直到 Ctrl+C"""
+    watcher = make_watcher(directory, interval, force_polling)
+    state = WatchState(state_file)
+    pending = {}    # 路径 -> (最后一次事件时间, 当时的签名)
+    inflight = set()
+    lock = threading.Lock()
+    print(f"开始监视: {directory}（{type(watcher).__name__}）")
+
+    def on_done(key, signature, future):
+        with lock:
+            inflight.discard(key)
+        try:
+            outputs = future.result()
+            state.mark(key, signature)
+            print(f"✓ 完成: {key} -> {', '.join(outputs)}")
+        except Exception as e:
+            print(f"✗ 处理失败: {key}: {e}")
+
+    try:
+        while True:
+            now = time.time()
+            for path in watcher.poll(timeout=min(debounce, interval)):
+                pending[path] = (now, file_signature(path))
+
+            now = time.time()
+            for path, (seen, signature) in list(pending.items()):
+                if now - seen < debounce:
+                    continue
+                del pending[path]
+                current = file_signature(path)
+                if current is None:
+                    continue
+                if current != signature:
+                    # 仍在写入，重新计时
+                    pending[path] = (now, current)
+                    continue
+
+                resolved = target.resolve(path)
+                if resolved is None:
+                    continue
+                key, signatures = resolved
+                with lock:
+                    if key in inflight:
+                        # 处理期间文件又有变化，放回等待队列，任务结束后按新签名重新判断
+                        pending[path] = (now, current)
+                        continue
+                    if state.is_processed(key, signatures):
+                        continue
+                    inflight.add(key)
+                print(f"分发: {key}")
+                future = target.submit(key)
+                future.add_done_callback(lambda f, k=key, s=signatures: on_done(k, s, f))
+    except KeyboardInterrupt:
+        print("\n停止监视")
+    finally:
+        watcher.close()
+        target.executor.shutdown(wait=True)